@@ -1,11 +1,17 @@
 """
 Gestor de base de datos SQLite para Mitsy's POS
 """
+import atexit
 import sqlite3
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator
 import os
-from utils import get_current_datetime
+from utils import get_current_datetime, normalize_text
 
 class Database:
     def __init__(self, db_path: str = "data/mitsys.db"):
@@ -16,32 +22,258 @@ class Database:
         self.db_path = db_path
         self.conn = None
         self.cursor = None
+        self._in_tx = False
+        self._write_lock = threading.RLock()
+        self._read_pool = queue.Queue(maxsize=self._READ_POOL_SIZE)
+        # Caché de recetas por producto: el camino más caliente de una
+        # venta consulta las mismas recetas una y otra vez
+        self._recetas_cache: Dict[int, List[Dict]] = {}
+        # Caché write-through de configuración y caché LRU de productos:
+        # get_config y get_producto se consultan en cada paso del bucle de
+        # venta y sus valores cambian rara vez
+        self._config_cache: Dict[str, Optional[str]] = {}
+        self._productos_cache: OrderedDict = OrderedDict()
         self.connect()
-        self.create_tables()
-        self.init_config()
+        # El esquema solo se crea/migra cuando la versión guardada en el
+        # archivo no coincide: en un arranque normal los CREATE TABLE /
+        # INSERT OR IGNORE ni siquiera se parsean, queda un PRAGMA de
+        # lectura. Una sola transacción para toda la creación: un fsync
+        version = self.cursor.execute('PRAGMA user_version').fetchone()[0]
+        if version < self._SCHEMA_VERSION:
+            self.conn.execute('BEGIN')
+            self.create_tables()
+            self.init_config()
+            self.cursor.execute(f'PRAGMA user_version = {self._SCHEMA_VERSION}')
+            self.conn.commit()
+        # Estadísticas frescas para el planificador al arrancar; el cierre
+        # vuelve a ejecutarlo para capturar lo escrito durante la sesión
+        self.cursor.execute('PRAGMA optimize')
+
+        # Cierre garantizado al salir del proceso: sin esto el WAL queda
+        # sin checkpoint y el archivo -wal crece entre sesiones
+        atexit.register(self.close)
     
+    # Versión del esquema guardada en PRAGMA user_version: increméntala
+    # al tocar create_tables, índices, triggers o migraciones para que
+    # las bases existentes vuelvan a pasar por la creación/migración
+    _SCHEMA_VERSION = 3
+
+    # Conexiones de solo lectura disponibles para consultas concurrentes
+    _READ_POOL_SIZE = 4
+
+    # Entradas máximas del caché LRU de get_producto
+    _PRODUCTO_CACHE_SIZE = 100
+
     def connect(self):
-        """Establece conexión con la base de datos"""
-        self.conn = sqlite3.connect(self.db_path)
+        """Establece conexión con la base de datos (conexión escritora)
+
+        Hay una única conexión escritora (SQLite solo admite un escritor a
+        la vez) protegida por _write_lock; las lecturas salen de un pequeño
+        pool de conexiones de solo lectura, que en modo WAL pueden ejecutar
+        en paralelo mientras el escritor confirma ventas o cortes.
+        """
+        # cached_statements amplio para que las sentencias preparadas de los
+        # getters calientes no se vayan expulsando del caché y re-parseando.
+        # isolation_level=None: sin transacciones implícitas del módulo
+        # sqlite3; los BEGIN/COMMIT los controla esta clase (tx, mutadores)
+        self.conn = sqlite3.connect(self.db_path, cached_statements=256,
+                                    check_same_thread=False,
+                                    isolation_level=None)
         self.conn.row_factory = sqlite3.Row
+        # normalize() disponible desde SQL: el filtro sin acentos puede
+        # ejecutarse dentro del motor en lugar de fila por fila en Python
+        self.conn.create_function('normalize', 1, normalize_text,
+                                  deterministic=True)
         self.cursor = self.conn.cursor()
-    
+
+        # Ajustes de rendimiento de SQLite:
+        # - WAL permite lecturas concurrentes mientras se escribe y reduce
+        #   el costo de fsync de los commits frecuentes (ventas, cortes, stock)
+        # - synchronous=NORMAL es seguro en modo WAL y evita un fsync por commit
+        # page_size debe fijarse antes de que se cree la primera tabla
+        self.cursor.execute('PRAGMA page_size=4096')
+        if self.db_path != ':memory:':
+            self.cursor.execute('PRAGMA journal_mode=WAL')
+        self.cursor.execute('PRAGMA synchronous=NORMAL')
+        self.cursor.execute('PRAGMA busy_timeout=5000')
+        self.cursor.execute('PRAGMA cache_size=-65536')
+        self.cursor.execute('PRAGMA temp_store=MEMORY')
+        self.cursor.execute('PRAGMA foreign_keys=ON')
+        # I/O mapeado en memoria (256 MiB): las lecturas se sirven directo
+        # del page cache del kernel, sin syscalls ni copias intermedias.
+        # Solo afecta lecturas, es seguro combinarlo con WAL.
+        self.cursor.execute('PRAGMA mmap_size=268435456')
+
+    @contextmanager
+    def tx(self):
+        """Agrupa varias operaciones en una sola transacción
+
+        Los métodos mutadores confirman por sí solos cuando se usan
+        individualmente, pero dentro de `with db.tx():` difieren el commit
+        al cierre del bloque, de modo que una operación lógica compuesta
+        (p.ej. venta + descuento de inventario) cuesta un solo fsync.
+        Los bloques anidados se pliegan en la transacción externa.
+        """
+        if self._in_tx:
+            yield self
+            return
+
+        with self._write_lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self._in_tx = True
+            try:
+                yield self
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                # Los cachés se llenan write-through durante el bloque;
+                # tras un rollback pueden contener valores no confirmados
+                self._recetas_cache.clear()
+                self._config_cache.clear()
+                self._productos_cache.clear()
+                raise
+            finally:
+                self._in_tx = False
+
+    def _maybe_commit(self):
+        """Confirma salvo que haya una transacción externa abierta"""
+        if not self._in_tx:
+            self.conn.commit()
+
+    def _new_read_conn(self) -> sqlite3.Connection:
+        """Abre una conexión de solo lectura para el pool"""
+        conn = sqlite3.connect(self.db_path, cached_statements=256,
+                               check_same_thread=False,
+                               isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.create_function('normalize', 1, normalize_text,
+                             deterministic=True)
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.execute('PRAGMA cache_size=-20000')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA mmap_size=268435456')
+        cursor.execute('PRAGMA query_only=ON')
+        return conn
+
+    @contextmanager
+    def _read_cursor(self):
+        """Entrega un cursor para consultas de solo lectura
+
+        Normalmente el cursor viene de una conexión del pool de lectura,
+        así las consultas no compiten con la conexión escritora. Dentro de
+        una transacción (o con base en memoria, que no se puede compartir
+        entre conexiones) se lee por la conexión escritora para ver los
+        cambios aún no confirmados.
+        """
+        if self.db_path == ':memory:' or self._in_tx:
+            yield self.conn.cursor()
+            return
+
+        try:
+            conn = self._read_pool.get_nowait()
+        except queue.Empty:
+            conn = self._new_read_conn()
+
+        try:
+            yield conn.cursor()
+        finally:
+            try:
+                self._read_pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def read_cursor(self):
+        """Cursor de solo lectura para consultas fuera de esta clase
+
+        La interfaz consulta reportes directamente (cortes, ventas del
+        día); con este context manager esas consultas salen del pool de
+        lectura en vez de compartir self.cursor con las escrituras, y
+        pueden ejecutarse desde cualquier hilo.
+        """
+        with self._read_cursor() as cursor:
+            yield cursor
+
+    def _iter_rows(self, query: str, params: tuple = ()) -> Iterator[Dict]:
+        """Ejecuta una consulta y produce sus filas como dicts, por lotes
+
+        Usa un cursor propio (para no pisar self.cursor si otro método se
+        ejecuta a mitad de la iteración) y fetchmany para no materializar
+        la tabla completa: el consumidor recibe la primera fila sin esperar
+        a que termine la consulta. dict(zip(...)) con los nombres de
+        columna cacheados es más barato que construir sqlite3.Row + dict.
+        """
+        with self._read_cursor() as cursor:
+            cursor.row_factory = None
+            cursor.execute(query, params)
+            columns = [d[0] for d in cursor.description]
+
+            while True:
+                rows = cursor.fetchmany(256)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(columns, row))
+
+    @staticmethod
+    def _fetchall_dicts(cursor) -> List[Dict]:
+        """Materializa el resultado pendiente de un cursor como dicts
+
+        Misma técnica que _iter_rows: tuplas crudas + dict(zip(...)) con
+        los nombres de columna calculados una sola vez por consulta, en
+        lugar de construir un sqlite3.Row y copiarlo a dict fila por fila.
+        """
+        cursor.row_factory = None
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def checkpoint(self):
+        """Vuelca el WAL a la base de datos para evitar que crezca demasiado"""
+        self.cursor.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
     def close(self):
-        """Cierra la conexión"""
+        """Cierra la conexión escritora y el pool de lectura"""
+        while True:
+            try:
+                self._read_pool.get_nowait().close()
+            except queue.Empty:
+                break
+
         if self.conn:
+            try:
+                # Actualizar estadísticas del planificador y volcar el WAL
+                # antes de cerrar; si la base está ocupada no es fatal
+                self.conn.execute('PRAGMA optimize')
+                if self.db_path != ':memory:':
+                    self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            except sqlite3.Error:
+                pass
             self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def create_tables(self):
         """Crea todas las tablas necesarias"""
-        
+
+        # Las tablas nuevas se crean como STRICT (SQLite >= 3.37): los tipos
+        # declarados se aplican de verdad y las filas empaquetan mejor.
+        # Las bases existentes conservan su definición original, ya que
+        # CREATE TABLE IF NOT EXISTS no las modifica.
+
         # Tabla de Configuración Global
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS configuracion (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 clave TEXT UNIQUE NOT NULL,
                 valor TEXT,
-                fecha_modificacion TEXT
-            )
+                fecha_modificacion TEXT NOT NULL
+            ) STRICT
         ''')
         
         # Tabla de Productos (ID manual)
@@ -51,29 +283,30 @@ class Database:
                 nombre TEXT NOT NULL,
                 precio_unitario REAL NOT NULL,
                 costo REAL NOT NULL,
-                ganancia REAL,
-                unidad_medida TEXT DEFAULT 'Pza',
-                stock_estimado REAL DEFAULT 0,
-                stock_minimo REAL DEFAULT 0,
-                gestion_stock INTEGER DEFAULT 0,
+                ganancia REAL GENERATED ALWAYS AS (precio_unitario - costo) VIRTUAL,
+                unidad_medida TEXT NOT NULL DEFAULT 'Pza',
+                stock_estimado REAL NOT NULL DEFAULT 0,
+                stock_minimo REAL NOT NULL DEFAULT 0,
+                gestion_stock INTEGER NOT NULL DEFAULT 0,
                 imagen TEXT,
-                activo INTEGER DEFAULT 1,
-                fecha_creacion TEXT
-            )
+                activo INTEGER NOT NULL DEFAULT 1,
+                fecha_creacion TEXT NOT NULL
+            ) STRICT
         ''')
-        
+        self._migrate_ganancia_generada()
+
         # Tabla de Ingredientes (ID manual)
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS ingredientes (
                 id INTEGER PRIMARY KEY,
                 nombre TEXT NOT NULL,
-                unidad_almacen TEXT DEFAULT 'Kg',
+                unidad_almacen TEXT NOT NULL DEFAULT 'Kg',
                 costo_unitario REAL NOT NULL,
-                cantidad_stock REAL DEFAULT 0,
-                gestion_stock INTEGER DEFAULT 0,
-                activo INTEGER DEFAULT 1,
-                fecha_creacion TEXT
-            )
+                cantidad_stock REAL NOT NULL DEFAULT 0,
+                gestion_stock INTEGER NOT NULL DEFAULT 0,
+                activo INTEGER NOT NULL DEFAULT 1,
+                fecha_creacion TEXT NOT NULL
+            ) STRICT
         ''')
         
         # Tabla de Recetas (ID manual)
@@ -83,10 +316,10 @@ class Database:
                 id_producto INTEGER NOT NULL,
                 id_ingrediente INTEGER NOT NULL,
                 cantidad_requerida REAL NOT NULL,
-                unidad_porcionamiento TEXT DEFAULT 'Kg',
+                unidad_porcionamiento TEXT NOT NULL DEFAULT 'Kg',
                 FOREIGN KEY (id_producto) REFERENCES productos(id) ON DELETE CASCADE,
                 FOREIGN KEY (id_ingrediente) REFERENCES ingredientes(id) ON DELETE CASCADE
-            )
+            ) STRICT
         ''')
         
         # Tabla de Ventas
@@ -95,18 +328,18 @@ class Database:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 numero_venta INTEGER NOT NULL,
                 fecha TEXT NOT NULL,
-                producto TEXT NOT NULL,
                 id_producto INTEGER,
                 cantidad REAL NOT NULL,
                 precio_unitario REAL NOT NULL,
                 total REAL NOT NULL,
-                metodo_pago TEXT DEFAULT 'Efectivo',
+                metodo_pago TEXT NOT NULL DEFAULT 'Efectivo',
                 mesa TEXT,
-                propina REAL DEFAULT 0,
+                propina REAL NOT NULL DEFAULT 0,
                 FOREIGN KEY (id_producto) REFERENCES productos(id)
-            )
+            ) STRICT
         ''')
-        
+        self._migrate_ventas_sin_nombre()
+
         # Tabla de Cortes
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS cortes (
@@ -116,11 +349,11 @@ class Database:
                 dinero_en_caja REAL NOT NULL,
                 corte_final REAL NOT NULL,
                 corte_esperado REAL NOT NULL,
-                retiros REAL DEFAULT 0,
+                retiros REAL NOT NULL DEFAULT 0,
                 diferencia REAL NOT NULL,
-                estado TEXT,
+                estado TEXT NOT NULL,
                 ganancias REAL NOT NULL
-            )
+            ) STRICT
         ''')
         
         # Tabla de Dinero en Caja
@@ -132,23 +365,327 @@ class Database:
                 denominacion INTEGER NOT NULL,
                 cantidad INTEGER NOT NULL,
                 total REAL NOT NULL,
-                tipo_registro TEXT DEFAULT 'apertura'
-            )
+                tipo_registro TEXT NOT NULL DEFAULT 'apertura'
+            ) STRICT
         ''')
         
-        # Tabla de Ventas Pendientes
+        # Tabla de Ventas Pendientes. Las líneas del carrito viven en una
+        # tabla hija en lugar de un blob JSON: añadir o quitar una línea
+        # toca una fila, sin re-serializar el carrito completo
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS ventas_pendientes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 mesa TEXT NOT NULL,
-                productos TEXT,
-                total REAL DEFAULT 0,
-                fecha_creacion TEXT
-            )
+                total REAL NOT NULL DEFAULT 0,
+                fecha_creacion TEXT NOT NULL
+            ) STRICT
         ''')
-        
-        self.conn.commit()
-    
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ventas_pendientes_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id_pendiente INTEGER NOT NULL,
+                id_producto INTEGER,
+                nombre TEXT NOT NULL,
+                cantidad REAL NOT NULL,
+                precio REAL NOT NULL,
+                total REAL NOT NULL,
+                FOREIGN KEY (id_pendiente) REFERENCES ventas_pendientes(id)
+                    ON DELETE CASCADE
+            ) STRICT
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_vpi_pendiente
+            ON ventas_pendientes_items(id_pendiente)
+        ''')
+        self._migrate_ventas_pendientes_items()
+
+        # Índices para las columnas calientes de WHERE/JOIN:
+        # sin ellos cada búsqueda o join recorre la tabla completa
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_recetas_producto ON recetas(id_producto)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_recetas_ingrediente ON recetas(id_ingrediente)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas(fecha)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ventas_id_producto ON ventas(id_producto)
+        ''')
+        # Índices parciales: solo cubren las filas activas, que es lo único
+        # que consultan los listados y las búsquedas
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_productos_activo
+            ON productos(activo) WHERE activo = 1
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ingredientes_activo
+            ON ingredientes(activo) WHERE activo = 1
+        ''')
+
+        self._create_search_index()
+        self._create_columna_nombre_normalizado()
+        self._create_costo_triggers()
+        self._create_stock_triggers()
+
+    def _costo_trigger_sql(self, ref: str) -> str:
+        """SQL que recalcula el costo de un producto dentro de un trigger
+
+        `ref` es NEW.id_producto u OLD.id_producto según el trigger. El
+        EXISTS conserva el comportamiento de recalcular_costo_producto:
+        un producto que se queda sin recetas no ve su costo tocado.
+        """
+        return f'''
+            UPDATE productos
+            SET costo = (SELECT COALESCE(SUM(r.cantidad_requerida * i.costo_unitario), 0)
+                         FROM recetas r
+                         JOIN ingredientes i ON i.id = r.id_ingrediente
+                         WHERE r.id_producto = {ref} AND i.activo = 1)
+            WHERE id = {ref}
+              AND EXISTS (SELECT 1 FROM recetas r
+                          JOIN ingredientes i ON i.id = r.id_ingrediente
+                          WHERE r.id_producto = {ref} AND i.activo = 1);
+        '''
+
+    def _create_costo_triggers(self):
+        """Triggers que mantienen productos.costo al escribir recetas
+
+        Con ellos, add/update/delete_receta son una sola sentencia: el
+        recálculo del costo ocurre dentro de SQLite en la misma
+        transacción, sin una segunda consulta ni un segundo commit desde
+        Python. El trigger de UPDATE cubre también el caso de mover una
+        receta de un producto a otro.
+        """
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS recetas_costo_ai
+            AFTER INSERT ON recetas BEGIN
+                {self._costo_trigger_sql('NEW.id_producto')}
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS recetas_costo_au
+            AFTER UPDATE ON recetas BEGIN
+                {self._costo_trigger_sql('OLD.id_producto')}
+                {self._costo_trigger_sql('NEW.id_producto')}
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS recetas_costo_ad
+            AFTER DELETE ON recetas BEGIN
+                {self._costo_trigger_sql('OLD.id_producto')}
+            END
+        ''')
+
+    def _stock_trigger_sql(self, condicion: str) -> str:
+        """SQL que recalcula stock_estimado dentro de un trigger
+
+        `condicion` acota los productos afectados (por referencia NEW/OLD
+        del trigger). Solo toca productos activos con gestión de stock,
+        igual que actualizar_todos_stocks_estimados.
+        """
+        return f'''
+            UPDATE productos
+            SET stock_estimado = COALESCE(
+                (SELECT CAST(MIN(i.cantidad_stock /
+                             NULLIF(r.cantidad_requerida, 0)) AS INTEGER)
+                 FROM recetas r
+                 JOIN ingredientes i ON i.id = r.id_ingrediente
+                 WHERE r.id_producto = productos.id
+                   AND r.cantidad_requerida > 0 AND i.activo = 1), 0)
+            WHERE gestion_stock = 1 AND activo = 1 AND {condicion};
+        '''
+
+    def _create_stock_triggers(self):
+        """Triggers que mantienen productos.stock_estimado al día
+
+        Cualquier movimiento de stock de un ingrediente (venta, compra,
+        ajuste) o cambio de receta recalcula el stock estimado de los
+        productos afectados dentro de la misma sentencia: el valor
+        almacenado ya no depende de que Python recuerde refrescarlo.
+        """
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS ingredientes_stock_au
+            AFTER UPDATE OF cantidad_stock, activo ON ingredientes BEGIN
+                {self._stock_trigger_sql(
+                    'id IN (SELECT id_producto FROM recetas '
+                    'WHERE id_ingrediente = NEW.id)')}
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS recetas_stock_ai
+            AFTER INSERT ON recetas BEGIN
+                {self._stock_trigger_sql('id = NEW.id_producto')}
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS recetas_stock_au
+            AFTER UPDATE ON recetas BEGIN
+                {self._stock_trigger_sql('id = OLD.id_producto')}
+                {self._stock_trigger_sql('id = NEW.id_producto')}
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS recetas_stock_ad
+            AFTER DELETE ON recetas BEGIN
+                {self._stock_trigger_sql('id = OLD.id_producto')}
+            END
+        ''')
+
+    def _migrate_ventas_pendientes_items(self):
+        """Normaliza los carritos pendientes guardados como JSON
+
+        En bases anteriores cada mesa guardaba su carrito serializado en
+        la columna TEXT `productos`; aquí se reparten esas líneas en
+        ventas_pendientes_items y se suelta la columna.
+        """
+        self.cursor.execute('PRAGMA table_info(ventas_pendientes)')
+        columnas = [row['name'] for row in self.cursor.fetchall()]
+        if 'productos' not in columnas:
+            return
+
+        import json
+        self.cursor.execute('SELECT id, productos FROM ventas_pendientes')
+        for fila in self.cursor.fetchall():
+            try:
+                items = json.loads(fila['productos'])
+            except (TypeError, ValueError):
+                items = []
+            self.cursor.executemany('''
+                INSERT INTO ventas_pendientes_items
+                    (id_pendiente, id_producto, nombre, cantidad, precio, total)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(fila['id'], item.get('id'), item.get('nombre', ''),
+                   item.get('cantidad', 0), item.get('precio', 0),
+                   item.get('total', 0))
+                  for item in items])
+
+        self.cursor.execute('ALTER TABLE ventas_pendientes DROP COLUMN productos')
+
+    def _migrate_ventas_sin_nombre(self):
+        """Elimina el nombre de producto duplicado en ventas
+
+        Cada línea de venta copiaba el nombre del producto como TEXT
+        además de id_producto: bytes duplicados por fila y un bind extra
+        en el camino caliente del ticket. En bases existentes se suelta
+        la columna; la vista ventas_v la sigue exponiendo resuelta por
+        JOIN para consultas y herramientas que esperen `producto`.
+        """
+        self.cursor.execute('PRAGMA table_info(ventas)')
+        columnas = [row['name'] for row in self.cursor.fetchall()]
+        if 'producto' in columnas:
+            self.cursor.execute('ALTER TABLE ventas DROP COLUMN producto')
+
+        self.cursor.execute('''
+            CREATE VIEW IF NOT EXISTS ventas_v AS
+            SELECT v.*, p.nombre AS producto
+            FROM ventas v
+            LEFT JOIN productos p ON p.id = v.id_producto
+        ''')
+
+    def _migrate_ganancia_generada(self):
+        """Convierte ganancia en columna generada en bases existentes
+
+        En bases creadas antes del cambio, ganancia es una columna
+        almacenada que había que recalcular en cada escritura. La columna
+        no participa en índices ni triggers, así que basta soltarla y
+        volver a añadirla como generada (hidden=2 en table_xinfo).
+        """
+        self.cursor.execute('PRAGMA table_xinfo(productos)')
+        for row in self.cursor.fetchall():
+            if row['name'] == 'ganancia' and row['hidden'] == 0:
+                self.cursor.execute('ALTER TABLE productos DROP COLUMN ganancia')
+                self.cursor.execute('''
+                    ALTER TABLE productos ADD COLUMN ganancia REAL
+                    GENERATED ALWAYS AS (precio_unitario - costo) VIRTUAL
+                ''')
+                break
+
+    def _create_columna_nombre_normalizado(self):
+        """Mantiene una columna con el nombre del producto ya normalizado
+
+        Es el camino de respaldo cuando FTS5 no está disponible: con la
+        columna precalculada el LIKE no tiene que normalizar cada fila en
+        el momento de la búsqueda. La columna se rellena aquí para bases
+        existentes y se mantiene desde add_producto / update_producto
+        (no con triggers: un trigger que actualice productos dispararía
+        los triggers del índice FTS en mitad del INSERT).
+        """
+        self.cursor.execute('PRAGMA table_info(productos)')
+        columnas = [row['name'] for row in self.cursor.fetchall()]
+
+        if 'nombre_normalizado' not in columnas:
+            self.cursor.execute('''
+                ALTER TABLE productos ADD COLUMN nombre_normalizado TEXT
+            ''')
+            self.cursor.execute('''
+                UPDATE productos SET nombre_normalizado = normalize(nombre)
+            ''')
+
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_productos_nombre_norm
+            ON productos(nombre_normalizado) WHERE activo = 1
+        ''')
+
+    def _create_search_index(self):
+        """Crea el índice de texto completo (FTS5) para buscar productos
+
+        El tokenizador unicode61 con remove_diacritics hace la búsqueda
+        insensible a acentos y mayúsculas directamente en SQLite, sin tener
+        que filtrar en Python. Si esta compilación de SQLite no incluye
+        FTS5, el índice simplemente no se crea y search_productos usa el
+        respaldo LIKE.
+        """
+        self.cursor.execute('''
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name = 'productos_fts'
+        ''')
+        ya_existia = self.cursor.fetchone() is not None
+
+        try:
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+                    nombre,
+                    content='productos',
+                    content_rowid='id',
+                    tokenize="unicode61 remove_diacritics 2"
+                )
+            ''')
+        except sqlite3.OperationalError:
+            return
+
+        # Triggers para mantener el índice sincronizado con productos
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS productos_fts_ai
+            AFTER INSERT ON productos BEGIN
+                INSERT INTO productos_fts(rowid, nombre)
+                VALUES (NEW.id, NEW.nombre);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS productos_fts_ad
+            AFTER DELETE ON productos BEGIN
+                INSERT INTO productos_fts(productos_fts, rowid, nombre)
+                VALUES ('delete', OLD.id, OLD.nombre);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS productos_fts_au
+            AFTER UPDATE ON productos BEGIN
+                INSERT INTO productos_fts(productos_fts, rowid, nombre)
+                VALUES ('delete', OLD.id, OLD.nombre);
+                INSERT INTO productos_fts(rowid, nombre)
+                VALUES (NEW.id, NEW.nombre);
+            END
+        ''')
+
+        # Si el índice se acaba de crear sobre una base con datos,
+        # poblarlo con los productos existentes
+        if not ya_existia:
+            self.cursor.execute('''
+                INSERT INTO productos_fts(productos_fts) VALUES ('rebuild')
+            ''')
+
     def init_config(self):
         """Inicializa configuraciones por defecto"""
         configs = [
@@ -162,26 +699,51 @@ class Database:
             self.cursor.execute('''
                 INSERT OR IGNORE INTO configuracion (clave, valor, fecha_modificacion)
                 VALUES (?, ?, ?)
-            ''', (clave, valor, datetime.now().strftime('%d/%m/%Y %H:%M:%S')))
-        
-        self.conn.commit()
-    
+            ''', (clave, valor, get_current_datetime()))
+
     # ==================== CONFIGURACIÓN ====================
-    
+
+    # SQL de los caminos más calientes como constantes de clase: la misma
+    # cadena en cada llamada garantiza aciertos en el caché de sentencias
+    # preparadas de la conexión
+    _SQL_GET_CONFIG = 'SELECT valor FROM configuracion WHERE clave = ?'
+    _SQL_SET_CONFIG = '''
+        INSERT OR REPLACE INTO configuracion (clave, valor, fecha_modificacion)
+        VALUES (?, ?, ?)
+    '''
+    _SQL_GET_PRODUCTO = 'SELECT * FROM productos WHERE id = ?'
+    _SQL_GET_INGREDIENTE = 'SELECT * FROM ingredientes WHERE id = ?'
+    _SQL_INSERT_VENTA = '''
+        INSERT INTO ventas (numero_venta, fecha, id_producto, cantidad,
+                          precio_unitario, total, metodo_pago, mesa, propina)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    _SQL_RECETAS_PRODUCTO = '''
+        SELECT r.*, i.nombre as ingrediente_nombre, i.unidad_almacen,
+               i.costo_unitario, i.cantidad_stock
+        FROM recetas r
+        JOIN ingredientes i ON r.id_ingrediente = i.id
+        WHERE r.id_producto = ? AND i.activo = 1
+    '''
+
     def get_config(self, clave: str) -> Optional[str]:
         """Obtiene un valor de configuración"""
-        self.cursor.execute('SELECT valor FROM configuracion WHERE clave = ?', (clave,))
-        result = self.cursor.fetchone()
-        return result['valor'] if result else None
-    
+        if clave in self._config_cache:
+            return self._config_cache[clave]
+
+        with self._read_cursor() as cursor:
+            cursor.execute(self._SQL_GET_CONFIG, (clave,))
+            result = cursor.fetchone()
+        valor = result['valor'] if result else None
+        self._config_cache[clave] = valor
+        return valor
+
     def set_config(self, clave: str, valor: str):
         """Establece un valor de configuración"""
-        fecha = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-        self.cursor.execute('''
-            INSERT OR REPLACE INTO configuracion (clave, valor, fecha_modificacion)
-            VALUES (?, ?, ?)
-        ''', (clave, valor, fecha))
-        self.conn.commit()
+        fecha = get_current_datetime()
+        self.cursor.execute(self._SQL_SET_CONFIG, (clave, valor, fecha))
+        self._config_cache[clave] = valor
+        self._maybe_commit()
     
     def is_gestion_stock_active(self) -> bool:
         """Verifica si la gestión de stock está activa globalmente"""
@@ -204,41 +766,134 @@ class Database:
         self.set_config('dinero_ingresado_hoy', fecha_hoy)
     
     # ==================== VALIDACIÓN DE IDs ====================
-    
+
+    # SQL constante por tabla: así el caché de sentencias preparadas de
+    # sqlite3 acierta en lugar de recompilar un f-string distinto cada vez.
+    # SELECT 1 ... LIMIT 1 evita construir una fila completa solo para
+    # descartarla; el diccionario además sirve de lista blanca de tablas.
+    _ID_EXISTS_SQL = {
+        'productos': 'SELECT 1 FROM productos WHERE id = ? LIMIT 1',
+        'ingredientes': 'SELECT 1 FROM ingredientes WHERE id = ? LIMIT 1',
+        'recetas': 'SELECT 1 FROM recetas WHERE id = ? LIMIT 1',
+    }
+
     def id_exists(self, table: str, id_value: int) -> bool:
         """Verifica si un ID ya existe en una tabla"""
-        self.cursor.execute(f'SELECT id FROM {table} WHERE id = ?', (id_value,))
-        return self.cursor.fetchone() is not None
+        with self._read_cursor() as cursor:
+            cursor.execute(self._ID_EXISTS_SQL[table], (id_value,))
+            return cursor.fetchone() is not None
+
+    # Columnas actualizables por tabla: lista blanca para los kwargs de
+    # los update_* (ningún nombre de columna llega al SQL sin validar)
+    _UPDATE_COLS = {
+        'productos': frozenset({'id', 'nombre', 'nombre_normalizado',
+                                'precio_unitario', 'costo', 'unidad_medida',
+                                'stock_estimado', 'stock_minimo',
+                                'gestion_stock', 'imagen', 'activo'}),
+        'ingredientes': frozenset({'id', 'nombre', 'unidad_almacen',
+                                   'costo_unitario', 'cantidad_stock',
+                                   'gestion_stock', 'activo'}),
+        'recetas': frozenset({'id', 'id_producto', 'id_ingrediente',
+                              'cantidad_requerida', 'unidad_porcionamiento'}),
+    }
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _make_update(table: str, keys: frozenset) -> str:
+        """Construye (y memoiza) el UPDATE para un conjunto de columnas
+
+        Los update_* reciben subconjuntos de kwargs que se repiten entre
+        llamadas; memoizar el SQL por frozenset de claves hace que el
+        caché de sentencias preparadas de la conexión acierte en vez de
+        recompilar un f-string distinto cada vez. Las columnas se ordenan
+        para que el mismo conjunto produzca siempre la misma sentencia.
+        """
+        invalidas = keys - Database._UPDATE_COLS[table]
+        if invalidas:
+            raise ValueError(
+                f"Columnas no válidas para {table}: {', '.join(sorted(invalidas))}")
+
+        fields = ', '.join(f'{col} = ?' for col in sorted(keys))
+        return f'UPDATE {table} SET {fields} WHERE id = ?'
     
+    # Desplazamiento temporal para renumerar sin chocar con IDs existentes
+    _RENUM_OFFSET = 1000000
+
     def reorganize_ids(self, table: str):
         """Reorganiza los IDs de una tabla para que sean continuos"""
-        # Obtener todos los registros ordenados por ID
-        self.cursor.execute(f'SELECT * FROM {table} WHERE activo = 1 ORDER BY id')
-        registros = [dict(row) for row in self.cursor.fetchall()]
-        
-        # Eliminar todos los registros
-        self.cursor.execute(f'DELETE FROM {table}')
-        
-        # Reinsertar con IDs continuos
-        for idx, registro in enumerate(registros, start=1):
-            old_id = registro['id']
-            registro['id'] = idx
-            
-            # Construir query de inserción
-            columns = ', '.join(registro.keys())
-            placeholders = ', '.join(['?' for _ in registro])
-            values = list(registro.values())
-            
-            self.cursor.execute(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', values)
-            
+        if table not in ('productos', 'ingredientes', 'recetas'):
+            raise ValueError(f"Tabla no soportada: {table}")
+
+        self.conn.execute('BEGIN IMMEDIATE')
+        # Posponer la validación de claves foráneas hasta el COMMIT:
+        # mientras renumeramos, las referencias apuntan a IDs viejos
+        self.cursor.execute('PRAGMA defer_foreign_keys=ON')
+        try:
+            # Las tablas con borrado lógico descartan aquí sus filas inactivas
+            if table == 'productos':
+                self.cursor.execute('''
+                    UPDATE ventas SET id_producto = NULL
+                    WHERE id_producto IN (SELECT id FROM productos WHERE activo = 0)
+                ''')
+            if table != 'recetas':
+                self.cursor.execute(f'DELETE FROM {table} WHERE activo = 0')
+
+            # Mapa ID viejo -> ID consecutivo, calculado en una sola pasada
+            self.cursor.execute('DROP TABLE IF EXISTS temp._renum')
+            self.cursor.execute(f'''
+                CREATE TEMP TABLE _renum AS
+                SELECT id AS old_id,
+                       row_number() OVER (ORDER BY id) AS new_id
+                FROM {table}
+            ''')
+
+            # Renumerar en dos pasos para evitar colisiones de unicidad
+            self.cursor.execute(f'UPDATE {table} SET id = id + {self._RENUM_OFFSET}')
+            self.cursor.execute(f'''
+                UPDATE {table}
+                SET id = (SELECT new_id FROM _renum
+                          WHERE old_id = {table}.id - {self._RENUM_OFFSET})
+            ''')
+
             # Actualizar referencias en otras tablas si es necesario
             if table == 'productos':
-                self.cursor.execute('UPDATE recetas SET id_producto = ? WHERE id_producto = ?', (idx, old_id))
-                self.cursor.execute('UPDATE ventas SET id_producto = ? WHERE id_producto = ?', (idx, old_id))
+                self.cursor.execute('''
+                    UPDATE recetas
+                    SET id_producto = (SELECT new_id FROM _renum
+                                       WHERE old_id = recetas.id_producto)
+                    WHERE id_producto IN (SELECT old_id FROM _renum)
+                ''')
+                self.cursor.execute('''
+                    UPDATE ventas
+                    SET id_producto = (SELECT new_id FROM _renum
+                                       WHERE old_id = ventas.id_producto)
+                    WHERE id_producto IN (SELECT old_id FROM _renum)
+                ''')
             elif table == 'ingredientes':
-                self.cursor.execute('UPDATE recetas SET id_ingrediente = ? WHERE id_ingrediente = ?', (idx, old_id))
-        
-        self.conn.commit()
+                self.cursor.execute('''
+                    UPDATE recetas
+                    SET id_ingrediente = (SELECT new_id FROM _renum
+                                          WHERE old_id = recetas.id_ingrediente)
+                    WHERE id_ingrediente IN (SELECT old_id FROM _renum)
+                ''')
+
+            self.cursor.execute('DROP TABLE _renum')
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        self._invalidate_recetas_cache()
+        self._invalidate_productos_cache()
+
+    def compact_ids(self, table: str):
+        """Compacta los IDs de una tabla (mantenimiento manual, no automático)
+
+        Los borrados son lógicos y dejan huecos en la numeración; esta
+        operación reescribe la tabla, así que solo debe invocarse de forma
+        explícita (p.ej. desde un botón de mantenimiento), no en cada borrado.
+        """
+        self.reorganize_ids(table)
     
     # ==================== PRODUCTOS ====================
     
@@ -250,92 +905,169 @@ class Database:
         if self.id_exists('productos', id_producto):
             raise ValueError(f"El ID {id_producto} ya existe")
         
-        ganancia = precio - costo
-        fecha = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-        
+        fecha = get_current_datetime()
+
         self.cursor.execute('''
-            INSERT INTO productos (id, nombre, precio_unitario, costo, ganancia, 
-                                 unidad_medida, stock_estimado, stock_minimo,
-                                 gestion_stock, imagen, fecha_creacion)
+            INSERT INTO productos (id, nombre, nombre_normalizado, precio_unitario,
+                                 costo, unidad_medida, stock_estimado,
+                                 stock_minimo, gestion_stock, imagen, fecha_creacion)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (id_producto, nombre, precio, costo, ganancia, unidad, stock_estimado, 
-              stock_minimo, 1 if gestion_stock else 0, imagen, fecha))
+        ''', (id_producto, nombre, normalize_text(nombre), precio, costo,
+              unidad, stock_estimado, stock_minimo, 1 if gestion_stock else 0,
+              imagen, fecha))
         
-        self.conn.commit()
+        self._maybe_commit()
         return id_producto
-    
-    def get_productos(self, activos_only: bool = True) -> List[Dict]:
-        """Obtiene todos los productos"""
+
+    def bulk_add_productos(self, productos: List[Dict]) -> int:
+        """Añade varios productos en una sola transacción
+
+        Cada elemento usa las mismas claves que los argumentos de
+        add_producto. Si algún ID ya existe, la transacción completa se
+        revierte.
+        """
+        fecha = get_current_datetime()
+        params = [(prod['id_producto'], prod['nombre'], normalize_text(prod['nombre']),
+                   prod['precio'], prod['costo'], prod.get('unidad', 'Pza'),
+                   prod.get('stock_estimado', 0), prod.get('stock_minimo', 0),
+                   1 if prod.get('gestion_stock') else 0, prod.get('imagen'), fecha)
+                  for prod in productos]
+
+        with self.tx():
+            self.cursor.executemany('''
+                INSERT INTO productos (id, nombre, nombre_normalizado, precio_unitario,
+                                     costo, unidad_medida, stock_estimado,
+                                     stock_minimo, gestion_stock, imagen, fecha_creacion)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', params)
+
+        return len(params)
+
+    def iter_productos(self, activos_only: bool = True) -> Iterator[Dict]:
+        """Itera todos los productos sin materializar la lista completa"""
         query = 'SELECT * FROM productos'
         if activos_only:
             query += ' WHERE activo = 1'
         query += ' ORDER BY id'
-        
-        self.cursor.execute(query)
-        return [dict(row) for row in self.cursor.fetchall()]
+
+        return self._iter_rows(query)
+
+    def get_productos(self, activos_only: bool = True) -> List[Dict]:
+        """Obtiene todos los productos"""
+        return list(self.iter_productos(activos_only))
     
     def get_producto(self, id_producto: int) -> Optional[Dict]:
         """Obtiene un producto por ID"""
-        self.cursor.execute('SELECT * FROM productos WHERE id = ?', (id_producto,))
-        result = self.cursor.fetchone()
-        return dict(result) if result else None
+        cached = self._productos_cache.get(id_producto)
+        if cached is not None:
+            self._productos_cache.move_to_end(id_producto)
+            # Copia: quien llama puede modificar el dict sin tocar el caché
+            return dict(cached)
+
+        with self._read_cursor() as cursor:
+            cursor.execute(self._SQL_GET_PRODUCTO, (id_producto,))
+            result = cursor.fetchone()
+        if result is None:
+            return None
+
+        producto = dict(result)
+        self._productos_cache[id_producto] = producto
+        if len(self._productos_cache) > self._PRODUCTO_CACHE_SIZE:
+            self._productos_cache.popitem(last=False)
+        return dict(producto)
+
+    def _invalidate_productos_cache(self):
+        """Vacía el caché de productos ante cualquier escritura sobre ellos"""
+        self._productos_cache.clear()
     
     def update_producto(self, old_id: int, new_id: int = None, **kwargs):
         """Actualiza un producto (permite cambiar el ID)"""
-        # Si se quiere cambiar el ID
-        if new_id and new_id != old_id:
-            if self.id_exists('productos', new_id):
-                raise ValueError(f"El ID {new_id} ya existe")
-            
-            # Actualizar referencias en recetas
-            self.cursor.execute('UPDATE recetas SET id_producto = ? WHERE id_producto = ?', 
-                              (new_id, old_id))
-            
-            # Actualizar referencias en ventas
-            self.cursor.execute('UPDATE ventas SET id_producto = ? WHERE id_producto = ?', 
-                              (new_id, old_id))
-            
-            kwargs['id'] = new_id
-        
-        # Recalcular ganancia si se actualiza precio o costo
-        if 'precio_unitario' in kwargs or 'costo' in kwargs:
-            producto = self.get_producto(old_id)
-            precio = kwargs.get('precio_unitario', producto['precio_unitario'])
-            costo = kwargs.get('costo', producto['costo'])
-            kwargs['ganancia'] = precio - costo
-        
-        if kwargs:
-            fields = ', '.join([f"{k} = ?" for k in kwargs.keys()])
-            values = list(kwargs.values()) + [old_id]
-            
-            self.cursor.execute(f'UPDATE productos SET {fields} WHERE id = ?', values)
-            self.conn.commit()
-    
+        with self.tx():
+            # Si se quiere cambiar el ID
+            if new_id and new_id != old_id:
+                if self.id_exists('productos', new_id):
+                    raise ValueError(f"El ID {new_id} ya existe")
+
+                # Posponer la validación de claves foráneas hasta el COMMIT:
+                # las referencias se actualizan antes que la fila padre
+                self.cursor.execute('PRAGMA defer_foreign_keys=ON')
+
+                # Actualizar referencias en recetas
+                self.cursor.execute('UPDATE recetas SET id_producto = ? WHERE id_producto = ?',
+                                  (new_id, old_id))
+
+                # Actualizar referencias en ventas
+                self.cursor.execute('UPDATE ventas SET id_producto = ? WHERE id_producto = ?',
+                                  (new_id, old_id))
+
+                self._invalidate_recetas_cache()
+                kwargs['id'] = new_id
+
+            # ganancia es columna generada: se deriva sola de precio y costo
+
+            # Mantener sincronizada la columna de búsqueda normalizada
+            if 'nombre' in kwargs:
+                kwargs['nombre_normalizado'] = normalize_text(kwargs['nombre'])
+
+            if kwargs:
+                sql = self._make_update('productos', frozenset(kwargs))
+                values = [kwargs[k] for k in sorted(kwargs)] + [old_id]
+
+                self.cursor.execute(sql, values)
+
+            self._invalidate_productos_cache()
+
     def delete_producto(self, id_producto: int):
-        """Elimina un producto y reorganiza los IDs"""
+        """Elimina un producto (borrado lógico)"""
         self.cursor.execute('UPDATE productos SET activo = 0 WHERE id = ?', (id_producto,))
-        self.conn.commit()
-        
-        # Reorganizar IDs para que sean continuos
-        self.reorganize_ids('productos')
+        self._invalidate_productos_cache()
+        self._maybe_commit()
     
     def search_productos(self, query: str) -> List[Dict]:
-        """Busca productos por nombre"""
-        from utils import normalize_text
-        normalized_query = normalize_text(query)
-        
-        self.cursor.execute('SELECT * FROM productos WHERE activo = 1')
-        productos = [dict(row) for row in self.cursor.fetchall()]
-        
-        resultados = [p for p in productos 
-                     if normalized_query in normalize_text(p['nombre'])]
-        
-        return resultados
+        """Busca productos por nombre (ignora acentos y mayúsculas)"""
+        # Convertir la consulta en términos de prefijo FTS: cada palabra
+        # entre comillas (evita errores de sintaxis) y con * al final
+        tokens = [t.replace('"', '') for t in query.split()]
+        match = ' '.join(f'"{t}"*' for t in tokens if t)
+
+        if not match:
+            return self.get_productos()
+
+        try:
+            with self._read_cursor() as cursor:
+                cursor.execute('''
+                    SELECT p.*
+                    FROM productos_fts f
+                    JOIN productos p ON p.id = f.rowid
+                    WHERE productos_fts MATCH ? AND p.activo = 1
+                    ORDER BY p.id
+                ''', (match,))
+                return self._fetchall_dicts(cursor)
+        except sqlite3.OperationalError:
+            # Respaldo si FTS5 no está disponible en esta compilación
+            return self._search_productos_like(query)
+
+    def _search_productos_like(self, query: str) -> List[Dict]:
+        """Búsqueda de respaldo con LIKE sobre nombres normalizados
+
+        Compara contra la columna nombre_normalizado que mantienen los
+        triggers: normalize() se evalúa una sola vez sobre el texto
+        buscado en lugar de una vez por fila.
+        """
+        with self._read_cursor() as cursor:
+            cursor.execute('''
+                SELECT * FROM productos
+                WHERE activo = 1
+                  AND nombre_normalizado LIKE '%' || normalize(?) || '%'
+                ORDER BY id
+            ''', (query,))
+            return self._fetchall_dicts(cursor)
     
     def get_next_producto_id(self) -> int:
         """Obtiene el siguiente ID disponible para productos"""
-        self.cursor.execute('SELECT MAX(id) as max_id FROM productos')
-        result = self.cursor.fetchone()
+        with self._read_cursor() as cursor:
+            cursor.execute('SELECT MAX(id) as max_id FROM productos')
+            result = cursor.fetchone()
         max_id = result['max_id'] if result['max_id'] else 0
         return max_id + 1
     
@@ -348,7 +1080,7 @@ class Database:
         if self.id_exists('ingredientes', id_ingrediente):
             raise ValueError(f"El ID {id_ingrediente} ya existe")
         
-        fecha = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        fecha = get_current_datetime()
         
         self.cursor.execute('''
             INSERT INTO ingredientes (id, nombre, unidad_almacen, costo_unitario,
@@ -357,51 +1089,62 @@ class Database:
         ''', (id_ingrediente, nombre, unidad, costo_unitario, cantidad, 
               1 if gestion_stock else 0, fecha))
         
-        self.conn.commit()
+        self._maybe_commit()
         return id_ingrediente
     
-    def get_ingredientes(self, activos_only: bool = True) -> List[Dict]:
-        """Obtiene todos los ingredientes"""
+    def iter_ingredientes(self, activos_only: bool = True) -> Iterator[Dict]:
+        """Itera todos los ingredientes sin materializar la lista completa"""
         query = 'SELECT * FROM ingredientes'
         if activos_only:
             query += ' WHERE activo = 1'
         query += ' ORDER BY id'
-        
-        self.cursor.execute(query)
-        return [dict(row) for row in self.cursor.fetchall()]
+
+        return self._iter_rows(query)
+
+    def get_ingredientes(self, activos_only: bool = True) -> List[Dict]:
+        """Obtiene todos los ingredientes"""
+        return list(self.iter_ingredientes(activos_only))
     
     def get_ingrediente(self, id_ingrediente: int) -> Optional[Dict]:
         """Obtiene un ingrediente por ID"""
-        self.cursor.execute('SELECT * FROM ingredientes WHERE id = ?', (id_ingrediente,))
-        result = self.cursor.fetchone()
+        with self._read_cursor() as cursor:
+            cursor.execute(self._SQL_GET_INGREDIENTE, (id_ingrediente,))
+            result = cursor.fetchone()
         return dict(result) if result else None
     
     def update_ingrediente(self, old_id: int, new_id: int = None, **kwargs):
         """Actualiza un ingrediente (permite cambiar el ID)"""
-        if new_id and new_id != old_id:
-            if self.id_exists('ingredientes', new_id):
-                raise ValueError(f"El ID {new_id} ya existe")
-            
-            # Actualizar referencias en recetas
-            self.cursor.execute('UPDATE recetas SET id_ingrediente = ? WHERE id_ingrediente = ?', 
-                              (new_id, old_id))
-            
-            kwargs['id'] = new_id
-        
-        if kwargs:
-            fields = ', '.join([f"{k} = ?" for k in kwargs.keys()])
-            values = list(kwargs.values()) + [old_id]
-            
-            self.cursor.execute(f'UPDATE ingredientes SET {fields} WHERE id = ?', values)
-            self.conn.commit()
+        with self.tx():
+            if new_id and new_id != old_id:
+                if self.id_exists('ingredientes', new_id):
+                    raise ValueError(f"El ID {new_id} ya existe")
+
+                # Posponer la validación de claves foráneas hasta el COMMIT:
+                # las referencias se actualizan antes que la fila padre
+                self.cursor.execute('PRAGMA defer_foreign_keys=ON')
+
+                # Actualizar referencias en recetas
+                self.cursor.execute('UPDATE recetas SET id_ingrediente = ? WHERE id_ingrediente = ?',
+                                  (new_id, old_id))
+
+                kwargs['id'] = new_id
+
+            if kwargs:
+                sql = self._make_update('ingredientes', frozenset(kwargs))
+                values = [kwargs[k] for k in sorted(kwargs)] + [old_id]
+
+                self.cursor.execute(sql, values)
+                self._invalidate_recetas_cache()
+                self._invalidate_productos_cache()
     
     def delete_ingrediente(self, id_ingrediente: int):
-        """Elimina un ingrediente y reorganiza los IDs"""
+        """Elimina un ingrediente (borrado lógico)"""
+        # El trigger ingredientes_stock_au recalcula stock_estimado de los
+        # productos afectados, así que el caché de productos también caduca
         self.cursor.execute('UPDATE ingredientes SET activo = 0 WHERE id = ?', (id_ingrediente,))
-        self.conn.commit()
-        
-        # Reorganizar IDs
-        self.reorganize_ids('ingredientes')
+        self._invalidate_recetas_cache()
+        self._invalidate_productos_cache()
+        self._maybe_commit()
     
     def registrar_compra_ingrediente(self, id_ingrediente: int, cantidad: float):
         """Registra una compra de ingrediente (suma al stock)"""
@@ -410,12 +1153,15 @@ class Database:
             SET cantidad_stock = cantidad_stock + ?
             WHERE id = ?
         ''', (cantidad, id_ingrediente))
-        self.conn.commit()
+        self._invalidate_recetas_cache()
+        self._invalidate_productos_cache()
+        self._maybe_commit()
     
     def get_next_ingrediente_id(self) -> int:
         """Obtiene el siguiente ID disponible para ingredientes"""
-        self.cursor.execute('SELECT MAX(id) as max_id FROM ingredientes')
-        result = self.cursor.fetchone()
+        with self._read_cursor() as cursor:
+            cursor.execute('SELECT MAX(id) as max_id FROM ingredientes')
+            result = cursor.fetchone()
         max_id = result['max_id'] if result['max_id'] else 0
         return max_id + 1
     
@@ -426,34 +1172,54 @@ class Database:
         """Añade una receta con ID específico"""
         if self.id_exists('recetas', id_receta):
             raise ValueError(f"El ID {id_receta} ya existe")
-        
+
+        # El trigger recetas_costo_ai recalcula el costo del producto
+        # dentro de la misma sentencia/transacción
         self.cursor.execute('''
             INSERT INTO recetas (id, id_producto, id_ingrediente, cantidad_requerida,
                                unidad_porcionamiento)
             VALUES (?, ?, ?, ?, ?)
         ''', (id_receta, id_producto, id_ingrediente, cantidad, unidad))
-        
-        self.conn.commit()
-        
-        # Recalcular costo del producto
-        self.recalcular_costo_producto(id_producto)
-        
+
+        self._invalidate_recetas_cache(id_producto)
+        self._invalidate_productos_cache()
+        self._maybe_commit()
+
         return id_receta
     
+    def _invalidate_recetas_cache(self, id_producto: int = None):
+        """Invalida el caché de recetas
+
+        Debe llamarse ante cualquier escritura sobre recetas o
+        ingredientes: las filas cacheadas incluyen costo_unitario y
+        cantidad_stock del ingrediente, así que también los movimientos
+        de stock las dejan obsoletas. Cuando la escritura solo puede
+        afectar a un producto (p.ej. añadir una receta nueva) se pasa su
+        ID y se descarta únicamente esa entrada; las escrituras sobre
+        ingredientes siguen vaciando todo, porque un ingrediente puede
+        aparecer en las recetas de cualquier producto.
+        """
+        if id_producto is not None:
+            self._recetas_cache.pop(id_producto, None)
+        else:
+            self._recetas_cache.clear()
+
     def get_recetas_producto(self, id_producto: int) -> List[Dict]:
         """Obtiene todas las recetas de un producto"""
-        self.cursor.execute('''
-            SELECT r.*, i.nombre as ingrediente_nombre, i.unidad_almacen,
-                   i.costo_unitario, i.cantidad_stock
-            FROM recetas r
-            JOIN ingredientes i ON r.id_ingrediente = i.id
-            WHERE r.id_producto = ? AND i.activo = 1
-        ''', (id_producto,))
-        return [dict(row) for row in self.cursor.fetchall()]
+        cached = self._recetas_cache.get(id_producto)
+        if cached is not None:
+            return cached
+
+        with self._read_cursor() as cursor:
+            cursor.execute(self._SQL_RECETAS_PRODUCTO, (id_producto,))
+            recetas = self._fetchall_dicts(cursor)
+
+        self._recetas_cache[id_producto] = recetas
+        return recetas
     
-    def get_todas_recetas(self) -> List[Dict]:
-        """Obtiene todas las recetas"""
-        self.cursor.execute('''
+    def iter_todas_recetas(self) -> Iterator[Dict]:
+        """Itera todas las recetas sin materializar la lista completa"""
+        return self._iter_rows('''
             SELECT r.*, p.nombre as producto_nombre, i.nombre as ingrediente_nombre
             FROM recetas r
             JOIN productos p ON r.id_producto = p.id
@@ -461,18 +1227,22 @@ class Database:
             WHERE p.activo = 1 AND i.activo = 1
             ORDER BY r.id
         ''')
-        return [dict(row) for row in self.cursor.fetchall()]
+
+    def get_todas_recetas(self) -> List[Dict]:
+        """Obtiene todas las recetas"""
+        return list(self.iter_todas_recetas())
     
     def get_receta(self, id_receta: int) -> Optional[Dict]:
         """Obtiene una receta por ID"""
-        self.cursor.execute('''
-            SELECT r.*, p.nombre as producto_nombre, i.nombre as ingrediente_nombre
-            FROM recetas r
-            JOIN productos p ON r.id_producto = p.id
-            JOIN ingredientes i ON r.id_ingrediente = i.id
-            WHERE r.id = ?
-        ''', (id_receta,))
-        result = self.cursor.fetchone()
+        with self._read_cursor() as cursor:
+            cursor.execute('''
+                SELECT r.*, p.nombre as producto_nombre, i.nombre as ingrediente_nombre
+                FROM recetas r
+                JOIN productos p ON r.id_producto = p.id
+                JOIN ingredientes i ON r.id_ingrediente = i.id
+                WHERE r.id = ?
+            ''', (id_receta,))
+            result = cursor.fetchone()
         return dict(result) if result else None
     
     def update_receta(self, old_id: int, new_id: int = None, **kwargs):
@@ -483,106 +1253,119 @@ class Database:
             kwargs['id'] = new_id
         
         if kwargs:
-            fields = ', '.join([f"{k} = ?" for k in kwargs.keys()])
-            values = list(kwargs.values()) + [old_id]
-            
-            self.cursor.execute(f'UPDATE recetas SET {fields} WHERE id = ?', values)
-            self.conn.commit()
-        
-        # Recalcular costo del producto
-        receta = self.get_receta(new_id if new_id else old_id)
-        if receta:
-            self.recalcular_costo_producto(receta['id_producto'])
+            sql = self._make_update('recetas', frozenset(kwargs))
+            values = [kwargs[k] for k in sorted(kwargs)] + [old_id]
+
+            # El trigger recetas_costo_au recalcula el costo del producto
+            # (del anterior y del nuevo, si la receta cambió de producto)
+            self.cursor.execute(sql, values)
+            self._invalidate_recetas_cache()
+            self._invalidate_productos_cache()
+            self._maybe_commit()
     
     def delete_receta(self, id_receta: int):
-        """Elimina una receta y reorganiza los IDs"""
-        # Obtener el producto antes de eliminar
-        receta = self.get_receta(id_receta)
-        
+        """Elimina una receta"""
+        # El trigger recetas_costo_ad recalcula el costo del producto
         self.cursor.execute('DELETE FROM recetas WHERE id = ?', (id_receta,))
-        self.conn.commit()
-        
-        # Reorganizar IDs
-        self.reorganize_ids('recetas')
-        
-        # Recalcular costo del producto
-        if receta:
-            self.recalcular_costo_producto(receta['id_producto'])
+        self._invalidate_recetas_cache()
+        self._invalidate_productos_cache()
+        self._maybe_commit()
     
     def get_next_receta_id(self) -> int:
         """Obtiene el siguiente ID disponible para recetas"""
-        self.cursor.execute('SELECT MAX(id) as max_id FROM recetas')
-        result = self.cursor.fetchone()
+        with self._read_cursor() as cursor:
+            cursor.execute('SELECT MAX(id) as max_id FROM recetas')
+            result = cursor.fetchone()
         max_id = result['max_id'] if result['max_id'] else 0
         return max_id + 1
     
     def recalcular_costo_producto(self, id_producto: int):
         """Recalcula el costo de un producto basado en sus recetas"""
-        recetas = self.get_recetas_producto(id_producto)
-        
-        if not recetas:
-            return
-        
-        costo_total = sum(r['cantidad_requerida'] * r['costo_unitario'] for r in recetas)
-        
+        # UPDATE correlacionado: el agregado se calcula dentro de SQLite
+        # sin materializar las recetas en Python. El EXISTS conserva el
+        # comportamiento previo de no tocar productos sin recetas.
         self.cursor.execute('''
-            UPDATE productos 
-            SET costo = ?, ganancia = precio_unitario - ?
+            UPDATE productos
+            SET costo = (SELECT COALESCE(SUM(r.cantidad_requerida * i.costo_unitario), 0)
+                         FROM recetas r
+                         JOIN ingredientes i ON i.id = r.id_ingrediente
+                         WHERE r.id_producto = productos.id AND i.activo = 1)
             WHERE id = ?
-        ''', (costo_total, costo_total, id_producto))
-        
-        self.conn.commit()
-    
+              AND EXISTS (SELECT 1 FROM recetas r
+                          JOIN ingredientes i ON i.id = r.id_ingrediente
+                          WHERE r.id_producto = productos.id AND i.activo = 1)
+        ''', (id_producto,))
+
+        self._invalidate_productos_cache()
+        self._maybe_commit()
+
     def calcular_stock_estimado(self, id_producto: int) -> float:
         """Calcula el stock estimado de un producto basado en sus ingredientes"""
-        recetas = self.get_recetas_producto(id_producto)
-        
-        if not recetas:
-            return 0
-        
-        capacidades = []
-        for receta in recetas:
-            if receta['cantidad_requerida'] > 0:
-                capacidad = receta['cantidad_stock'] / receta['cantidad_requerida']
-                capacidades.append(capacidad)
-        
-        return int(min(capacidades)) if capacidades else 0
+        # El mínimo de las capacidades (stock / cantidad requerida) se
+        # calcula directo en SQL; NULL significa que no hay recetas
+        with self._read_cursor() as cursor:
+            cursor.execute('''
+                SELECT CAST(MIN(i.cantidad_stock / r.cantidad_requerida) AS INTEGER) AS stock
+                FROM recetas r
+                JOIN ingredientes i ON i.id = r.id_ingrediente
+                WHERE r.id_producto = ? AND r.cantidad_requerida > 0 AND i.activo = 1
+            ''', (id_producto,))
+            result = cursor.fetchone()
+        return result['stock'] if result['stock'] is not None else 0
     
     def actualizar_stock_estimado(self, id_producto: int):
         """Actualiza el stock estimado de un producto en la base de datos"""
         stock = self.calcular_stock_estimado(id_producto)
-        self.cursor.execute('UPDATE productos SET stock_estimado = ? WHERE id = ?', 
+        self.cursor.execute('UPDATE productos SET stock_estimado = ? WHERE id = ?',
                           (stock, id_producto))
-        self.conn.commit()
+        self._invalidate_productos_cache()
+        self._maybe_commit()
     
     def actualizar_todos_stocks_estimados(self):
         """Actualiza el stock estimado de todos los productos con gestión de stock"""
-        productos = self.cursor.execute('''
-            SELECT id FROM productos WHERE gestion_stock = 1 AND activo = 1
-        ''').fetchall()
-        
-        for producto in productos:
-            self.actualizar_stock_estimado(producto['id'])
+        # Un solo UPDATE en lugar de consulta + UPDATE por producto. El CTE
+        # agrupa todas las capacidades en una sola pasada sobre recetas en
+        # vez de re-ejecutar la subconsulta producto por producto
+        self.cursor.execute('''
+            WITH caps AS (
+                SELECT r.id_producto,
+                       CAST(MIN(i.cantidad_stock /
+                                NULLIF(r.cantidad_requerida, 0)) AS INTEGER) AS stk
+                FROM recetas r
+                JOIN ingredientes i ON i.id = r.id_ingrediente
+                WHERE r.cantidad_requerida > 0 AND i.activo = 1
+                GROUP BY r.id_producto
+            )
+            UPDATE productos
+            SET stock_estimado = COALESCE(
+                (SELECT stk FROM caps WHERE caps.id_producto = productos.id), 0)
+            WHERE gestion_stock = 1 AND activo = 1
+        ''')
+        self._invalidate_productos_cache()
+        self._maybe_commit()
     
     # ==================== VENTAS ====================
     
     def descontar_inventario_por_venta(self, id_producto: int, cantidad_vendida: float):
         """Descuenta del inventario de ingredientes según la venta de un producto"""
-        recetas = self.get_recetas_producto(id_producto)
-        
-        for receta in recetas:
-            cantidad_a_descontar = receta['cantidad_requerida'] * cantidad_vendida
-            
+        # Un solo UPDATE correlacionado descuenta todos los ingredientes de
+        # la receta; el trigger ingredientes_stock_au recalcula el stock
+        # estimado de los productos afectados en la misma sentencia.
+        # El SUM cubre el caso de varias filas de receta por ingrediente
+        with self.tx():
             self.cursor.execute('''
                 UPDATE ingredientes
-                SET cantidad_stock = cantidad_stock - ?
-                WHERE id = ?
-            ''', (cantidad_a_descontar, receta['id_ingrediente']))
-        
-        self.conn.commit()
-        
-        # Actualizar stock estimado del producto
-        self.actualizar_stock_estimado(id_producto)
+                SET cantidad_stock = cantidad_stock -
+                    (SELECT SUM(r.cantidad_requerida) * ?
+                     FROM recetas r
+                     WHERE r.id_ingrediente = ingredientes.id
+                       AND r.id_producto = ?)
+                WHERE activo = 1
+                  AND id IN (SELECT id_ingrediente FROM recetas
+                             WHERE id_producto = ?)
+            ''', (cantidad_vendida, id_producto, id_producto))
+            self._invalidate_recetas_cache()
+            self._invalidate_productos_cache()
     
     # ==================== VENTAS (continuación) ====================
     
@@ -595,24 +1378,37 @@ class Database:
                   cantidad: float, precio: float, total: float,
                   metodo_pago: str = 'Efectivo', mesa: str = None, 
                   propina: float = 0) -> int:
-        """Añade una venta"""
+        """Añade una venta
+
+        `producto` se conserva en la firma por compatibilidad, pero el
+        nombre ya no se almacena: la vista ventas_v lo resuelve por JOIN.
+        """
         from utils import get_current_datetime  # Import aquí por si acaso
         fecha = get_current_datetime()
-        
-        self.cursor.execute('''
-            INSERT INTO ventas (numero_venta, fecha, producto, id_producto, cantidad,
-                              precio_unitario, total, metodo_pago, mesa, propina)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (numero_venta, fecha, producto, id_producto, cantidad, precio, 
-              total, metodo_pago, mesa, propina))
-        
-        self.conn.commit()
+
+        self.cursor.execute(self._SQL_INSERT_VENTA,
+                            (numero_venta, fecha, id_producto, cantidad,
+                             precio, total, metodo_pago, mesa, propina))
+
+        self._maybe_commit()
         
         # Actualizar último número de venta
         self.set_config('ultimo_numero_venta', str(numero_venta))
         
         return self.cursor.lastrowid
     
+    def add_ventas_bulk(self, rows: List[tuple]) -> int:
+        """Inserta varias líneas de venta en una sola transacción
+
+        Cada tupla sigue el orden de columnas de _SQL_INSERT_VENTA:
+        (numero_venta, fecha, id_producto, cantidad,
+        precio_unitario, total, metodo_pago, mesa, propina).
+        Un ticket de N líneas cuesta un solo commit en vez de N.
+        """
+        with self.tx():
+            self.cursor.executemany(self._SQL_INSERT_VENTA, rows)
+        return len(rows)
+
     def finalizar_venta(self, productos: list, metodo_pago: str, mesa: str = None,
                        propina: float = 0) -> int:
         """
@@ -620,71 +1416,159 @@ class Database:
         productos = [{'id': 1, 'nombre': 'Tacos', 'cantidad': 2, 'precio': 15.00, 'total': 30.00}, ...]
         """
         numero_venta = self.get_next_numero_venta()
-        
-        for prod in productos:
-            self.add_venta(numero_venta, prod['nombre'], prod['id'],
-                          prod['cantidad'], prod['precio'], prod['total'],
-                          metodo_pago, mesa, propina)
-            
+        fecha = get_current_datetime()
+
+        # Todas las líneas del ticket más el número de venta en un lote
+        rows = [(numero_venta, fecha, prod['id'],
+                 prod['cantidad'], prod['precio'], prod['total'],
+                 metodo_pago, mesa, propina)
+                for prod in productos]
+
+        # Una sola transacción para la venta completa: líneas del ticket,
+        # número de venta y descuentos de inventario cuestan un solo fsync
+        # y no pueden quedar a medias si algo falla entre pasos
+        with self.tx():
+            self.cursor.executemany(self._SQL_INSERT_VENTA, rows)
+            self.set_config('ultimo_numero_venta', str(numero_venta))
+
             # Descontar inventario si el producto gestiona stock
-            producto_db = self.get_producto(prod['id'])
-            if producto_db and producto_db['gestion_stock'] and self.is_gestion_stock_active():
-                self.descontar_inventario_por_venta(prod['id'], prod['cantidad'])
-        
+            if self.is_gestion_stock_active():
+                for prod in productos:
+                    producto_db = self.get_producto(prod['id'])
+                    if producto_db and producto_db['gestion_stock']:
+                        self.descontar_inventario_por_venta(prod['id'], prod['cantidad'])
+
         return numero_venta
     
     # ==================== VENTAS PENDIENTES ====================
     
     def save_venta_pendiente(self, mesa: str, productos: list, total: float):
-        """Guarda una venta pendiente"""
-        import json
+        """Guarda una venta pendiente (reemplaza el carrito completo)"""
         fecha = get_current_datetime()
-        productos_json = json.dumps(productos)
-        
-        # Verificar si ya existe una venta pendiente para esta mesa
-        self.cursor.execute('SELECT id FROM ventas_pendientes WHERE mesa = ?', (mesa,))
-        existing = self.cursor.fetchone()
-        
-        if existing:
-            # Actualizar
-            self.cursor.execute('''
-                UPDATE ventas_pendientes 
-                SET productos = ?, total = ?, fecha_creacion = ?
-                WHERE mesa = ?
-            ''', (productos_json, total, fecha, mesa))
-        else:
-            # Insertar
-            self.cursor.execute('''
-                INSERT INTO ventas_pendientes (mesa, productos, total, fecha_creacion)
-                VALUES (?, ?, ?, ?)
-            ''', (mesa, productos_json, total, fecha))
-        
-        self.conn.commit()
-    
+
+        with self.tx():
+            # Verificar si ya existe una venta pendiente para esta mesa
+            self.cursor.execute('SELECT id FROM ventas_pendientes WHERE mesa = ?', (mesa,))
+            existing = self.cursor.fetchone()
+
+            if existing:
+                id_pendiente = existing['id']
+                self.cursor.execute('''
+                    UPDATE ventas_pendientes
+                    SET total = ?, fecha_creacion = ?
+                    WHERE id = ?
+                ''', (total, fecha, id_pendiente))
+                self.cursor.execute('''
+                    DELETE FROM ventas_pendientes_items WHERE id_pendiente = ?
+                ''', (id_pendiente,))
+            else:
+                self.cursor.execute('''
+                    INSERT INTO ventas_pendientes (mesa, total, fecha_creacion)
+                    VALUES (?, ?, ?)
+                ''', (mesa, total, fecha))
+                id_pendiente = self.cursor.lastrowid
+
+            self.cursor.executemany('''
+                INSERT INTO ventas_pendientes_items
+                    (id_pendiente, id_producto, nombre, cantidad, precio, total)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(id_pendiente, prod['id'], prod['nombre'], prod['cantidad'],
+                   prod['precio'], prod['total'])
+                  for prod in productos])
+
     def get_venta_pendiente(self, mesa: str) -> Optional[Dict]:
         """Obtiene una venta pendiente de una mesa"""
-        import json
-        
-        self.cursor.execute('SELECT * FROM ventas_pendientes WHERE mesa = ?', (mesa,))
-        result = self.cursor.fetchone()
-        
-        if result:
+        with self._read_cursor() as cursor:
+            cursor.execute('SELECT * FROM ventas_pendientes WHERE mesa = ?', (mesa,))
+            result = cursor.fetchone()
+            if result is None:
+                return None
+
             venta = dict(result)
-            venta['productos'] = json.loads(venta['productos'])
-            return venta
-        
-        return None
-    
+            cursor.execute('''
+                SELECT id_producto AS id, nombre, cantidad, precio, total
+                FROM ventas_pendientes_items
+                WHERE id_pendiente = ?
+                ORDER BY rowid
+            ''', (venta['id'],))
+            venta['productos'] = self._fetchall_dicts(cursor)
+
+        return venta
+
+    def get_pending_items(self, id_pendiente: int) -> List[Dict]:
+        """Obtiene las líneas de una venta pendiente"""
+        return list(self._iter_rows('''
+            SELECT * FROM ventas_pendientes_items
+            WHERE id_pendiente = ?
+            ORDER BY id
+        ''', (id_pendiente,)))
+
+    def add_pending_item(self, id_pendiente: int, id_producto: int, nombre: str,
+                         cantidad: float, precio: float) -> int:
+        """Añade una línea a una venta pendiente sin reescribir el carrito"""
+        with self.tx():
+            self.cursor.execute('''
+                INSERT INTO ventas_pendientes_items
+                    (id_pendiente, id_producto, nombre, cantidad, precio, total)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (id_pendiente, id_producto, nombre, cantidad, precio,
+                  round(cantidad * precio, 2)))
+            item_id = self.cursor.lastrowid
+            self._refresh_pendiente_total(id_pendiente)
+        return item_id
+
+    def remove_pending_item(self, item_id: int):
+        """Quita una línea de una venta pendiente"""
+        with self.tx():
+            self.cursor.execute('''
+                SELECT id_pendiente FROM ventas_pendientes_items WHERE id = ?
+            ''', (item_id,))
+            result = self.cursor.fetchone()
+            if result is None:
+                return
+
+            self.cursor.execute('DELETE FROM ventas_pendientes_items WHERE id = ?',
+                              (item_id,))
+            self._refresh_pendiente_total(result['id_pendiente'])
+
+    def _refresh_pendiente_total(self, id_pendiente: int):
+        """Recalcula el total de una venta pendiente a partir de sus líneas"""
+        self.cursor.execute('''
+            UPDATE ventas_pendientes
+            SET total = COALESCE((SELECT ROUND(SUM(total), 2)
+                                  FROM ventas_pendientes_items
+                                  WHERE id_pendiente = ?), 0)
+            WHERE id = ?
+        ''', (id_pendiente, id_pendiente))
+
     def delete_venta_pendiente(self, mesa: str):
-        """Elimina una venta pendiente"""
+        """Elimina una venta pendiente (sus líneas caen por ON DELETE CASCADE)"""
         self.cursor.execute('DELETE FROM ventas_pendientes WHERE mesa = ?', (mesa,))
-        self.conn.commit()
+        self._maybe_commit()
     
     def get_mesas_con_ventas_pendientes(self) -> List[str]:
         """Obtiene lista de mesas con ventas pendientes"""
-        self.cursor.execute('SELECT mesa FROM ventas_pendientes')
-        return [row['mesa'] for row in self.cursor.fetchall()]
+        with self._read_cursor() as cursor:
+            cursor.execute('SELECT mesa FROM ventas_pendientes')
+            return [row['mesa'] for row in cursor.fetchall()]
     
+    # ==================== DINERO EN CAJA ====================
+
+    def add_dinero_caja_bulk(self, registros: List[tuple]) -> int:
+        """Registra el conteo de denominaciones en un solo lote
+
+        Cada tupla: (fecha, tipo, denominacion, cantidad, total,
+        tipo_registro). El conteo de apertura es inherentemente un lote,
+        así que se inserta con un executemany y un único commit.
+        """
+        with self.tx():
+            self.cursor.executemany('''
+                INSERT INTO dinero_caja
+                (fecha, tipo, denominacion, cantidad, total, tipo_registro)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', registros)
+        return len(registros)
+
     # ==================== CORTES ====================
     
     def get_next_numero_corte(self) -> int:
@@ -702,29 +1586,32 @@ class Database:
         dinero_inicial = float(self.get_config('dinero_inicial_dia') or 0)
         
         # Sumar todas las ventas del día (solo efectivo)
+        # Los agregados monetarios se redondean a centavos: la suma de
+        # muchos REAL acumula restos binarios (p.ej. 0.1 + 0.2) que harían
+        # oscilar el estado del corte alrededor de la tolerancia
         fecha_hoy = datetime.now().strftime('%d/%m/%Y')
         self.cursor.execute('''
-            SELECT SUM(total) as total_ventas
+            SELECT ROUND(SUM(total), 2) as total_ventas
             FROM ventas
             WHERE fecha LIKE ? AND metodo_pago = 'Efectivo'
         ''', (f'{fecha_hoy}%',))
-        
+
         result = self.cursor.fetchone()
         total_ventas = result['total_ventas'] if result['total_ventas'] else 0
-        
+
         # Calcular ganancias del día
         self.cursor.execute('''
-            SELECT SUM(v.total) - SUM(p.costo * v.cantidad) as ganancias
+            SELECT ROUND(SUM(v.total) - SUM(p.costo * v.cantidad), 2) as ganancias
             FROM ventas v
             JOIN productos p ON v.id_producto = p.id
             WHERE v.fecha LIKE ?
         ''', (f'{fecha_hoy}%',))
-        
+
         result = self.cursor.fetchone()
         ganancias = result['ganancias'] if result['ganancias'] else 0
-        
-        corte_esperado = dinero_inicial + total_ventas - retiros
-        diferencia = corte_final - corte_esperado
+
+        corte_esperado = round(dinero_inicial + total_ventas - retiros, 2)
+        diferencia = round(corte_final - corte_esperado, 2)
         
         # Determinar estado
         if abs(diferencia) < 0.01:  # Tolerancia de 1 centavo
@@ -741,7 +1628,7 @@ class Database:
         ''', (numero_corte, fecha, dinero_caja, corte_final, corte_esperado,
               retiros, diferencia, estado, ganancias))
         
-        self.conn.commit()
+        self._maybe_commit()
         
         # Actualizar último número de corte
         self.set_config('ultimo_numero_corte', str(numero_corte))
@@ -751,5 +1638,20 @@ class Database:
         
         return numero_corte
 
-# Instancia global de la base de datos
-db = Database()
\ No newline at end of file
+# Instancia global de la base de datos, creada de forma perezosa:
+# importar este módulo ya no abre la conexión ni crea tablas
+_db: Optional[Database] = None
+
+def get_db() -> Database:
+    """Devuelve la instancia global, creándola en el primer uso"""
+    global _db
+    if _db is None:
+        _db = Database()
+    return _db
+
+def __getattr__(name):
+    # Mantiene `from database import db` funcionando sin pagar el costo
+    # de abrir la base de datos en el momento del import
+    if name == 'db':
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -127,11 +127,11 @@ class IngredientesWindow:
         for item in self.tree.get_children():
             self.tree.delete(item)
         
-        ingredientes = db.get_ingredientes()
-        
+        ingredientes = db.iter_ingredientes()
+
         for idx, ing in enumerate(ingredientes):
             tag = 'evenrow' if idx % 2 == 0 else 'oddrow'
-            
+
             values = (
                 ing['id'],
                 ing['nombre'],
@@ -140,7 +140,7 @@ class IngredientesWindow:
                 f"{ing['cantidad_stock']:.2f}",
                 'Sí' if ing['gestion_stock'] else 'No'
             )
-            
+
             self.tree.insert('', tk.END, values=values, tags=(tag,))
     
     def search_ingredientes(self):
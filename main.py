@@ -359,17 +359,16 @@ class DineroCajaWindow:
             # Guardar en base de datos
             fecha = get_current_date()
             
+            registros = []
             for key, data in self.denominaciones_cantidad.items():
                 cantidad = int(data['var'].get())
                 if cantidad > 0:
-                    db.cursor.execute('''
-                        INSERT INTO dinero_caja 
-                        (fecha, tipo, denominacion, cantidad, total, tipo_registro)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (fecha, data['tipo'], data['denominacion'], cantidad,
-                          cantidad * data['denominacion'], 'apertura'))
-            
-            db.conn.commit()
+                    registros.append((fecha, data['tipo'], data['denominacion'],
+                                      cantidad, cantidad * data['denominacion'],
+                                      'apertura'))
+
+            if registros:
+                db.add_dinero_caja_bulk(registros)
             
             # Marcar como ingresado hoy
             db.mark_dinero_ingresado()
@@ -134,9 +134,9 @@ class ProductosWindow:
         for item in self.tree.get_children():
             self.tree.delete(item)
         
-        # Cargar productos
-        productos = db.get_productos()
-        
+        # Cargar productos (iterador: la tabla se llena por lotes)
+        productos = db.iter_productos()
+
         for idx, p in enumerate(productos):
             tag = 'evenrow' if idx % 2 == 0 else 'oddrow'
             
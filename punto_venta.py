@@ -551,12 +551,14 @@ class AgregarProductosWindow:
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
         
-        productos = db.get_productos()
-        
+        # Iterador en vez de lista: las primeras tarjetas se crean mientras
+        # SQLite sigue leyendo el resto del catálogo
+        productos = db.iter_productos()
+
         # Crear grid de productos (4 columnas para pantallas normales)
         row = 0
         col = 0
-        
+
         for producto in productos:
             self.create_producto_card(producto, row, col)
             
@@ -1368,25 +1370,26 @@ class FinalizarDiaWindow:
             fecha_hoy = datetime.now().strftime('%d/%m/%Y')
             
             # Calcular ventas del día (solo efectivo)
-            db.cursor.execute('''
-                SELECT SUM(total) as total_ventas
-                FROM ventas
-                WHERE fecha LIKE ? AND metodo_pago = 'Efectivo'
-            ''', (f'{fecha_hoy}%',))
-            
-            result = db.cursor.fetchone()
-            total_ventas = result['total_ventas'] if result['total_ventas'] else 0
-            
-            # Calcular ganancias
-            db.cursor.execute('''
-                SELECT SUM(v.total) - SUM(p.costo * v.cantidad) as ganancias
-                FROM ventas v
-                JOIN productos p ON v.id_producto = p.id
-                WHERE v.fecha LIKE ?
-            ''', (f'{fecha_hoy}%',))
-            
-            result = db.cursor.fetchone()
-            ganancias = result['ganancias'] if result['ganancias'] else 0
+            with db.read_cursor() as cursor:
+                cursor.execute('''
+                    SELECT SUM(total) as total_ventas
+                    FROM ventas
+                    WHERE fecha LIKE ? AND metodo_pago = 'Efectivo'
+                ''', (f'{fecha_hoy}%',))
+
+                result = cursor.fetchone()
+                total_ventas = result['total_ventas'] if result['total_ventas'] else 0
+
+                # Calcular ganancias
+                cursor.execute('''
+                    SELECT SUM(v.total) - SUM(p.costo * v.cantidad) as ganancias
+                    FROM ventas v
+                    JOIN productos p ON v.id_producto = p.id
+                    WHERE v.fecha LIKE ?
+                ''', (f'{fecha_hoy}%',))
+
+                result = cursor.fetchone()
+                ganancias = result['ganancias'] if result['ganancias'] else 0
             
             corte_esperado = dinero_inicial + total_ventas - egresos
             diferencia = corte_final - corte_esperado
@@ -169,9 +169,9 @@ class StockWindow:
         for item in self.tree.get_children():
             self.tree.delete(item)
         
-        productos = db.get_productos()
+        productos = db.iter_productos()
         gestion_activa = db.is_gestion_stock_active()
-        
+
         for idx, p in enumerate(productos):
             # Determinar el tag
             if gestion_activa and p['gestion_stock'] and p['stock_estimado'] < p['stock_minimo']:
@@ -2,6 +2,7 @@
 Funciones auxiliares y utilidades generales
 """
 import re
+import time
 from datetime import datetime
 from typing import Optional
 import unicodedata
@@ -68,6 +69,10 @@ def parse_datetime(date_str: str) -> Optional[datetime]:
         except:
             return None
 
+# Tabla de traducción para los acentos del español: str.translate corre
+# en C, sin descomponer ni recorrer el texto carácter por carácter
+_ACENTOS = str.maketrans('áéíóúÁÉÍÓÚñÑüÜ', 'aeiouAEIOUnNuU')
+
 def normalize_text(text: str) -> str:
     """
     Normaliza texto removiendo acentos y convirtiendo a minúsculas
@@ -75,10 +80,16 @@ def normalize_text(text: str) -> str:
     """
     if not text:
         return ""
-    # Remover acentos
-    nfkd = unicodedata.normalize('NFKD', text)
-    text_sin_acentos = ''.join([c for c in nfkd if not unicodedata.combining(c)])
-    return text_sin_acentos.lower()
+    # Sin acentos no hay nada que traducir
+    if text.isascii():
+        return text.lower()
+    # Remover acentos (la tabla cubre el español; unicodedata queda como
+    # respaldo para cualquier otro carácter no ASCII)
+    text = text.translate(_ACENTOS)
+    if not text.isascii():
+        nfkd = unicodedata.normalize('NFKD', text)
+        text = ''.join([c for c in nfkd if not unicodedata.combining(c)])
+    return text.lower()
 
 def validate_float(value: str) -> bool:
     """
@@ -100,17 +111,28 @@ def validate_int(value: str) -> bool:
     except ValueError:
         return False
 
-def get_current_date() -> str:
-    """
-    Obtiene la fecha actual en formato dd/mm/yyyy
-    """
-    return datetime.now().strftime('%d/%m/%Y')
+# Caché del último timestamp formateado: strftime es costoso y dentro del
+# mismo segundo el resultado no cambia, así que se formatea una sola vez
+_last_ts_sec = 0
+_last_ts_str = ''
 
 def get_current_datetime() -> str:
     """
     Obtiene la fecha y hora actual en formato dd/mm/yyyy hh:mm:ss
     """
-    return datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    global _last_ts_sec, _last_ts_str
+    now = int(time.time())
+    if now != _last_ts_sec:
+        _last_ts_sec = now
+        _last_ts_str = datetime.fromtimestamp(now).strftime('%d/%m/%Y %H:%M:%S')
+    return _last_ts_str
+
+def get_current_date() -> str:
+    """
+    Obtiene la fecha actual en formato dd/mm/yyyy
+    """
+    # Reutiliza el caché por segundo del timestamp completo
+    return get_current_datetime()[:10]
 
 def calculate_week_range(date: datetime = None) -> tuple:
     """